@@ -1,13 +1,14 @@
 import os
 import json
 
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from dotenv_vault import load_dotenv
 from flask import Flask, flash, get_flashed_messages, jsonify, redirect, render_template, url_for, request, session, g
 from flask_session import Session
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Integer, String, insert, select
+from sqlalchemy import Integer, String, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import DeclarativeBase, Mapped, class_mapper, mapped_column, relationship
 from sqlalchemy.exc import IntegrityError
 from typing import List
@@ -27,6 +28,7 @@ app.config['DEBUG'] = True  # Enable debug mode
 # Configure session to use filesystem (instead of signed cookies)
 app.config["SESSION_PERMANENT"] = False
 app.config["SESSION_TYPE"] = "filesystem"
+app.config["SESSION_FILE_DIR"] = os.getenv("SESSION_FILE_DIR", os.path.join(os.getcwd(), "flask_session"))
 app.secret_key = os.getenv("SECRET_KEY")
 
 Session(app)
@@ -40,7 +42,8 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///wisp.db"
+# Must be SQLite, balance rollups are written with SQLite's ON CONFLICT upsert
+app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///wisp.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 db.init_app(app)
@@ -53,10 +56,14 @@ class User(db.Model):
     password = db.Column(db.String(50), nullable=False)
     loans = db.relationship('Loans', back_populates='user', cascade='all, delete-orphan')
     simulated = db.relationship('Simulated', back_populates='user', cascade='all, delete-orphan')
+    balance_history = db.relationship('Balance_history', back_populates='user', cascade='all, delete-orphan')
+    balance_rollups = db.relationship('Balance_rollups', back_populates='user', cascade='all, delete-orphan')
     plans = db.relationship('Plans', back_populates='user')
 
 class Loans(db.Model):
     __tablename__ = 'loans'
+    # Never reuse a deleted loan's id, its balance history keeps pointing at it
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     amount = db.Column(db.Integer, nullable=False)
@@ -104,9 +111,56 @@ class Plan_payments(db.Model):
     plans = db.relationship('Plans', back_populates='plan_payments')
     loans = db.relationship('Loans', back_populates='plan_payments')
 
+class Balance_history(db.Model):
+    __tablename__ = 'balance_history'
+    # Append only log of every change to a loan's actual balance, stored as the change (delta)
+    # Summing deltas for a loan gives its balance at any point in time
+    # loan_id is a plain column, not a foreign key, so rows outlive the loan and still say which loan they were
+    id = db.Column(db.Integer, primary_key=True)
+    loan_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    date = db.Column(db.String(50), nullable=False)
+    delta = db.Column(db.Float, nullable=False)
+    user = db.relationship('User', back_populates='balance_history')
+
+class Balance_rollups(db.Model):
+    __tablename__ = 'balance_rollups'
+    # One row per loan per period ("day" is YYYY-MM-DD, "month" is YYYY-MM), kept up to date on every change
+    # change is the net of that period's deltas, summing change over every period up to P gives the user's total balance at the close of P
+    id = db.Column(db.Integer, primary_key=True)
+    loan_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    resolution = db.Column(db.String(10), nullable=False)
+    period = db.Column(db.String(10), nullable=False)
+    change = db.Column(db.Float, nullable=False)
+    user = db.relationship('User', back_populates='balance_rollups')
+    __table_args__ = (
+        db.UniqueConstraint('loan_id', 'resolution', 'period'),
+        db.Index('ix_balance_rollups_user_period', 'user_id', 'resolution', 'period'),
+    )
+
+
+ROLLUP_RESOLUTIONS = ("day", "month")
+
+def get_period(day, resolution):
+    if resolution == "month":
+        return day.strftime("%Y-%m")
+    return day.strftime("%Y-%m-%d")
+
+# One time migration, loans from before balance history existed start from their current balance
+def backfill_balance_history():
+    now = datetime.now()
+    unrecorded = db.session.scalars(select(Loans).where(Loans.amount != 0, ~select(Balance_history.id).where(Balance_history.loan_id == Loans.id).exists()))
+    for loan in unrecorded:
+        db.session.add(Balance_history(loan_id=loan.id, user_id=loan.user_id, date=now.isoformat(timespec="seconds"), delta=loan.amount))
+        for resolution in ROLLUP_RESOLUTIONS:
+            db.session.add(Balance_rollups(loan_id=loan.id, user_id=loan.user_id, resolution=resolution, period=get_period(now, resolution), change=loan.amount))
+    db.session.commit()
+
 
 with app.app_context():
     db.create_all()
+    backfill_balance_history()
     
 @app.before_request
 def before_request():
@@ -281,6 +335,7 @@ def add_loan():
         set_form_name("add-loan-form")
         if isinstance(loan, Loans):
             db.session.add(loan)
+            record_balance_change(loan, loan.amount)
             db.session.commit()
             flash(f"{loan.name} added successfully!", "success")
             return redirect("/manage-loans")
@@ -317,7 +372,9 @@ def edit_loan():
         if request.form.get("edit-amount"):
             new_amount = request.form.get("edit-amount")
             try:
+                old_amount = selected_loan.amount
                 selected_loan.amount = float(new_amount)
+                record_balance_change(selected_loan, selected_loan.amount - old_amount)
                 flash(f"{updated_name} balance updated", "success")
             except ValueError:
                 flash(f"{updated_name} balance not updated, enter number only", "danger")
@@ -350,6 +407,8 @@ def delete_loan():
         delete_loan_id = request.form.get("selected-option-id")
 
         delete_loan = db.session.scalar(select(Loans).where(Loans.id == delete_loan_id))
+        # Close out the balance so progress history still adds up once the loan is gone
+        record_balance_change(delete_loan, -delete_loan.amount)
         db.session.delete(delete_loan)
         db.session.commit()
         flash(f"{delete_loan.name} deleted successfully", "success")
@@ -377,12 +436,14 @@ def make_payment():
         
         payment_loan_id = request.form.get("selected-option-id")
         payment_loan = db.session.scalar(select(Loans).where(Loans.id == payment_loan_id))
-        payment_loan.amount = payment_loan.amount - float(request.form.get("payment-amount"))
+        payment_amount = float(request.form.get("payment-amount"))
+        payment_loan.amount = payment_loan.amount - payment_amount
         if payment_loan.amount < 0:
             flash("Payment amount cannot exceed loan balance", "danger")
             return redirect("/make-payment")
         else:
             update_monthly_interest(payment_loan)
+            record_balance_change(payment_loan, -payment_amount)
             db.session.commit()
         return redirect("/make-payment")
     
@@ -577,6 +638,27 @@ def retrieve_sim_data():
 
     return sim_dict
 
+@app.route("/retrieve-progress-data")
+@login_required
+def retrieve_progress_data():
+    resolution = request.args.get("resolution", "month")
+    if resolution not in ROLLUP_RESOLUTIONS:
+        resolution = "month"
+
+    # Optional YYYY-MM-DD window, both ends inclusive
+    try:
+        start = get_period(date.fromisoformat(request.args["start"]), resolution) if request.args.get("start") else None
+        end = get_period(date.fromisoformat(request.args["end"]), resolution) if request.args.get("end") else None
+    except ValueError:
+        return jsonify({"error": "start and end must be YYYY-MM-DD"}), 400
+
+    actual = get_actual_progress(session["user_id"], resolution, start, end)
+    simulated = get_simulated_progress(session["user_id"], resolution, start, end)
+
+    # Line both series up on the same periods, gaps are None
+    labels = sorted(set(actual) | set(simulated))
+    return jsonify({"labels": labels, "actual": [actual.get(period) for period in labels], "simulated": [simulated.get(period) for period in labels]})
+
 @app.route("/retrieve-loans")
 @login_required
 def retrieve_loans():
@@ -618,7 +700,7 @@ def avalanche(sim_loans, funds):
         if highest_id == None:
             break
         highest_loan = sim_loans[highest_id]
-        print(f"Highest loan = {highest_loan}\nBalance = {highest_loan["balance"]}\n")
+        print(f"Highest loan = {highest_loan}\nBalance = {highest_loan['balance']}\n")
         # If highest interest loan's balance is less than payment amount
         if highest_loan["balance"] < funds:
             paid = highest_loan["balance"]
@@ -638,4 +720,63 @@ def avalanche(sim_loans, funds):
             break
         
 
-# Create function to calculate length of time till all loans paid off
\ No newline at end of file
+# Create function to calculate length of time till all loans paid off
+
+
+# Call with the change to loan.amount, every loan already has its opening balance recorded
+def record_balance_change(loan, delta):
+    if delta == 0:
+        return
+    # Need the loan's id for the history row and rollup upsert
+    db.session.flush()
+    now = datetime.now()
+    db.session.add(Balance_history(loan_id=loan.id, user_id=loan.user_id, date=now.isoformat(timespec="seconds"), delta=delta))
+
+    # Keep the day and month rollups current so range queries never have to read the history
+    # Upsert so two changes to the same loan in the same period can't both insert a row
+    for resolution in ROLLUP_RESOLUTIONS:
+        rollup = sqlite_insert(Balance_rollups).values(loan_id=loan.id, user_id=loan.user_id, resolution=resolution, period=get_period(now, resolution), change=delta)
+        rollup = rollup.on_conflict_do_update(
+            index_elements=["loan_id", "resolution", "period"],
+            set_={"change": Balance_rollups.change + rollup.excluded.change},
+        )
+        db.session.execute(rollup)
+
+def sum_rollup_changes(user_id, resolution, *where):
+    return db.session.scalar(select(func.coalesce(func.sum(Balance_rollups.change), 0)).where(Balance_rollups.user_id == user_id, Balance_rollups.resolution == resolution, *where))
+
+# Total actual balance at the close of each period from start to end, one row read per period in the window
+def get_actual_progress(user_id, resolution, start=None, end=None):
+    query = select(Balance_rollups.period, func.sum(Balance_rollups.change)).where(Balance_rollups.user_id == user_id, Balance_rollups.resolution == resolution)
+
+    # Opening total is everything before the window, read from month rollups plus the days of start's month
+    total = 0
+    if start:
+        total = sum_rollup_changes(user_id, "month", Balance_rollups.period < start[:7])
+        if resolution == "day":
+            total += sum_rollup_changes(user_id, "day", Balance_rollups.period >= start[:7], Balance_rollups.period < start)
+        query = query.where(Balance_rollups.period >= start)
+    if end:
+        query = query.where(Balance_rollups.period <= end)
+
+    progress = dict()
+    for period, change in db.session.execute(query.group_by(Balance_rollups.period).order_by(Balance_rollups.period)):
+        # Periods with no changes are skipped, the chart carries the last total forward
+        total += change
+        progress[period] = round(total, 2)
+    return progress
+
+# Total balance of the last simulation at the close of each period from start to end
+def get_simulated_progress(user_id, resolution, start=None, end=None):
+    simmed_loans = db.session.scalars(select(Simulated).where(Simulated.user_id == user_id))
+    totals = dict()
+    for sim in simmed_loans:
+        totals[sim.date] = totals.get(sim.date, 0) + sim.balance
+
+    progress = dict()
+    for sim_date in sorted(totals):
+        period = get_period(date.fromisoformat(sim_date[:10]), resolution)
+        if (start and period < start) or (end and period > end):
+            continue
+        progress[period] = round(totals[sim_date], 2)
+    return progress
@@ -0,0 +1,59 @@
+Chart.defaults.color = '#FFFFFC80'
+Chart.defaults.font.size = '24'
+Chart.defaults.backgroundColor = '#FFFFFC'
+Chart.defaults.borderColor = '#FFFFFC30'
+
+let progressChart = null;
+
+async function loadProgress(resolution) {
+
+    const progress_response = await fetch('/retrieve-progress-data?resolution=' + resolution);
+    const data = await progress_response.json();
+    console.log('Progress data: ', data);
+
+    const ctx = document.getElementById('progress-chart');
+
+    const cfg = {
+        type: 'line',
+        data: {
+            labels: data.labels,
+            datasets: [
+                {
+                    label: 'Actual',
+                    data: data.actual,
+                    spanGaps: true
+                },
+                {
+                    label: 'Simulated',
+                    data: data.simulated,
+                    spanGaps: true,
+                    borderDash: [10, 10]
+                }
+            ]
+        },
+        options: {
+            scales: {
+                x: {
+                    position: 'bottom',
+                },
+                y: {
+                    ticks: {
+                        // Include a dollar sign in the ticks
+                        callback: function(value, index, ticks) {
+                            return '$' + value;
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    // Redraw when the resolution changes
+    if (progressChart) {
+        progressChart.destroy();
+    }
+    progressChart = new Chart(ctx, cfg);
+};
+
+
+loadProgress(document.getElementById('progress-resolution').value);
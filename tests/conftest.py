@@ -0,0 +1,38 @@
+import os
+
+import dotenv_vault
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def wisp(tmp_path_factory):
+    """Import the app against a throwaway database and session dir"""
+    tmp = tmp_path_factory.mktemp("wisp")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("DATABASE_URL", "sqlite:///" + str(tmp / "test.db"))
+        mp.setenv("SESSION_FILE_DIR", str(tmp / "flask_session"))
+        mp.setenv("SECRET_KEY", "test")
+        # Config comes from the environment above, there is no .env to load
+        mp.setattr(dotenv_vault, "load_dotenv", lambda: None)
+        mp.syspath_prepend(ROOT)
+        import app
+    app.app.config["TESTING"] = True
+    return app
+
+
+@pytest.fixture
+def client(wisp):
+    with wisp.app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def signup(wisp, client):
+    """Sign up a fresh user and return their id"""
+    def signup(username):
+        client.post("/signup", data={"name": "test", "username": username, "password": "pw", "confirm": "pw"})
+        with wisp.app.app_context():
+            return wisp.db.session.scalar(wisp.select(wisp.User.id).where(wisp.User.username == username))
+    return signup
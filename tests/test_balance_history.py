@@ -0,0 +1,82 @@
+import pytest
+
+
+def history_deltas(wisp, *where):
+    return wisp.db.session.scalars(wisp.select(wisp.Balance_history.delta).where(*where).order_by(wisp.Balance_history.id)).all()
+
+
+def add_legacy_loan(wisp, user_id, name, amount):
+    """Loan from before balance history existed, no history rows"""
+    loan = wisp.Loans(name=name, amount=amount, interest=5.0, monthly_interest=0, user_id=user_id)
+    wisp.db.session.add(loan)
+    wisp.db.session.commit()
+    return loan.id
+
+
+def test_backfill_legacy_loans(wisp, client, signup):
+    user_id = signup("legacy")
+
+    with wisp.app.app_context():
+        paid_id = add_legacy_loan(wisp, user_id, "A", 1000.0)
+        unpaid_id = add_legacy_loan(wisp, user_id, "B", 2000.0)
+        # What runs on startup
+        wisp.backfill_balance_history()
+
+    client.post("/make-payment", data={"payment-selected-loan": "A", "selected-option-id": paid_id, "payment-amount": "100"})
+
+    with wisp.app.app_context():
+        assert history_deltas(wisp, wisp.Balance_history.loan_id == paid_id) == [pytest.approx(1000), pytest.approx(-100)]
+        assert history_deltas(wisp, wisp.Balance_history.loan_id == unpaid_id) == [pytest.approx(2000)]
+        total = wisp.get_total(wisp.get_loans(user_id))
+
+        # Running it again doesn't record anything twice
+        wisp.backfill_balance_history()
+        assert len(history_deltas(wisp, wisp.Balance_history.user_id == user_id)) == 3
+
+    progress = client.get("/retrieve-progress-data?resolution=day").get_json()
+    assert progress["actual"][-1] == pytest.approx(total) == pytest.approx(2900)
+
+
+def test_delete_loan_keeps_history(wisp, client, signup):
+    user_id = signup("deleter")
+
+    client.post("/add-loan", data={"add-name": "Kept", "add-amount": "500", "add-interest": "4"})
+    client.post("/add-loan", data={"add-name": "Gone", "add-amount": "300", "add-interest": "6"})
+    with wisp.app.app_context():
+        gone_id = wisp.db.session.scalar(wisp.select(wisp.Loans.id).where(wisp.Loans.name == "Gone", wisp.Loans.user_id == user_id))
+
+    client.post("/make-payment", data={"payment-selected-loan": "Gone", "selected-option-id": gone_id, "payment-amount": "50"})
+    client.post("/make-payment", data={"payment-selected-loan": "Gone", "selected-option-id": gone_id, "payment-amount": "25"})
+    client.post("/delete-loan", data={"delete-selected-loan": "Gone", "selected-option-id": gone_id})
+
+    with wisp.app.app_context():
+        assert wisp.db.session.get(wisp.Loans, gone_id) is None
+        # add, two payments and the closing delta are all still there under the deleted loan's id
+        assert history_deltas(wisp, wisp.Balance_history.loan_id == gone_id) == [pytest.approx(300), pytest.approx(-50), pytest.approx(-25), pytest.approx(-225)]
+        assert sum(history_deltas(wisp, wisp.Balance_history.user_id == user_id)) == pytest.approx(wisp.get_total(wisp.get_loans(user_id)))
+        # Same day changes landed in one rollup row per loan per resolution
+        assert wisp.db.session.scalar(wisp.select(wisp.func.count()).where(wisp.Balance_rollups.user_id == user_id, wisp.Balance_rollups.resolution == "day")) == 2
+
+    progress = client.get("/retrieve-progress-data?resolution=month").get_json()
+    assert progress["actual"] == [pytest.approx(500)]
+
+
+def test_progress_range(wisp, client, signup):
+    user_id = signup("ranged")
+
+    # Rollups from earlier months, written directly so the dates are fixed
+    with wisp.app.app_context():
+        for period, change in [("2024-01", 1000), ("2024-02", -200), ("2024-03", -300)]:
+            wisp.db.session.add(wisp.Balance_rollups(loan_id=0, user_id=user_id, resolution="month", period=period, change=change))
+            wisp.db.session.add(wisp.Balance_rollups(loan_id=0, user_id=user_id, resolution="day", period=period + "-15", change=change))
+        wisp.db.session.commit()
+
+    progress = client.get("/retrieve-progress-data?resolution=month&start=2024-02-01&end=2024-02-28").get_json()
+    assert progress["labels"] == ["2024-02"]
+    assert progress["actual"] == [pytest.approx(800)]
+
+    progress = client.get("/retrieve-progress-data?resolution=day&start=2024-03-01").get_json()
+    assert progress["labels"] == ["2024-03-15"]
+    assert progress["actual"] == [pytest.approx(500)]
+
+    assert client.get("/retrieve-progress-data?start=March").status_code == 400